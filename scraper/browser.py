@@ -1,9 +1,17 @@
+import asyncio
 import logging
 import random
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
 from typing import Optional
+from urllib.parse import urlsplit
 
-from playwright.async_api import async_playwright, Browser as PWBrowser, BrowserContext, Page, Playwright, ProxySettings
+from playwright.async_api import (
+    async_playwright, Browser as PWBrowser, BrowserContext, Cookie, Page, Playwright, ProxySettings, StorageState,
+    StorageStateCookie,
+)
 
+from .captcha import INJECT_TOKEN_SCRIPT
 from .utils import load_config, setup_logging
 
 USER_AGENTS = [
@@ -20,6 +28,24 @@ WEBDRIVER_MASK_SCRIPT = """
     window.chrome = {runtime: {}};
 """
 
+# Resource types the CNMC form does not need; aborting them saves Tor bandwidth
+DEFAULT_BLOCKED_RESOURCE_TYPES = ["image", "font", "media"]
+
+BLOCKED_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+)
+
+# Blocking goes through CDP URL patterns rather than context.route(): a routed
+# context runs with the HTTP cache disabled, which would refetch the form's JS/CSS
+# through Tor on every page
+RESOURCE_TYPE_EXTENSIONS = {
+    "image": ("png", "jpg", "jpeg", "gif", "webp", "avif", "svg", "ico"),
+    "font": ("woff", "woff2", "ttf", "otf", "eot"),
+    "media": ("mp4", "webm", "mp3", "ogg", "wav"),
+}
+
 
 class Browser:
     """Playwright browser wrapper for CNMC form interaction via Tor SOCKS proxy."""
@@ -29,8 +55,27 @@ class Browser:
         self.logger: logging.Logger = setup_logging(self.config)
         self._playwright: Playwright | None = None
         self._browser: Optional[PWBrowser] = None
-        self._context: Optional[BrowserContext] = None
-        self._page: Optional[Page] = None
+        self._context_pool: asyncio.Queue[BrowserContext] | None = None
+        self._context_uses: dict[BrowserContext, int] = {}
+        # Consent cookies and CNMC localStorage captured after the first consent
+        # click; seeds every later context
+        self._storage_state: StorageState | None = None
+        self._consented: set[BrowserContext] = set()
+        # Read once here rather than on every page/context
+        scraping_cfg = self.config.get("scraping", {})
+        self.base_url: str = str(scraping_cfg.get(
+            "base_url", "https://numeracionyoperadores.cnmc.es/portabilidad/movil"
+        ))
+        self._timeout_ms: int = int(scraping_cfg.get("page_load_timeout_ms", 60000))
+        blocked_types = scraping_cfg.get("blocked_resource_types", DEFAULT_BLOCKED_RESOURCE_TYPES)
+        self._blocked_urls: list[str] = [
+            pattern
+            for resource_type in blocked_types
+            for ext in RESOURCE_TYPE_EXTENSIONS.get(resource_type, ())
+            for pattern in (f"*.{ext}", f"*.{ext}?*")
+        ] + [f"*{host}*" for host in BLOCKED_HOSTS]
+        # Long-lived contexts accumulate memory; recycle each after this many pages
+        self._context_max_pages: int = int(scraping_cfg.get("context_max_pages", 50))
 
     def _build_tor_proxy(self) -> "ProxySettings":
         """Build Tor SOCKS5 proxy dict from config."""
@@ -40,8 +85,33 @@ class Browser:
         proxy: "ProxySettings" = {"server": f"socks5://{host}:{port}"}
         return proxy
 
+    async def _new_context(self) -> BrowserContext:
+        """Create a context with a random user agent and webdriver masking."""
+        if self._browser is None:
+            raise RuntimeError("Browser not started")
+        user_agent = random.choice(USER_AGENTS)
+        context = await self._browser.new_context(
+            user_agent=user_agent,
+            storage_state=self._storage_state,
+        )
+        if self._storage_state is not None:
+            self._consented.add(context)
+        context.set_default_timeout(self._timeout_ms)
+        await context.add_init_script(WEBDRIVER_MASK_SCRIPT)
+        await context.add_init_script(INJECT_TOKEN_SCRIPT)
+        self._context_uses[context] = 0
+        self.logger.debug("New context with UA: %s", user_agent[:40])
+        return context
+
+    async def _block_requests(self, page: Page) -> None:
+        """Block non-essential resources and analytics on the page, keeping the HTTP cache."""
+        # The session lives as long as the page; detaching it would lift the block
+        cdp = await page.context.new_cdp_session(page)
+        await cdp.send("Network.enable")
+        await cdp.send("Network.setBlockedURLs", {"urls": self._blocked_urls})
+
     async def start(self) -> None:
-        """Launch Chromium with Tor SOCKS proxy and webdriver masking."""
+        """Launch Chromium with Tor SOCKS proxy and prewarm the context pool."""
         pw = await async_playwright().start()
         self._playwright = pw
         proxy = self._build_tor_proxy()
@@ -49,21 +119,26 @@ class Browser:
             headless=True,
             proxy=proxy,
         )
-        user_agent = random.choice(USER_AGENTS)
-        timeout_ms = int(self.config.get("scraping", {}).get("page_load_timeout_ms", 60000))
-        self._context = await self._browser.new_context(user_agent=user_agent)
-        self._context.set_default_timeout(timeout_ms)
-        page = await self._context.new_page()
-        await page.add_init_script(WEBDRIVER_MASK_SCRIPT)
-        self._page = page
-        self.logger.info("Browser started with Tor proxy and UA: %s", user_agent[:40])
+        scraping_cfg = self.config.get("scraping", {})
+        # At least one context per concurrent worker so none waits on the pool
+        pool_size = max(
+            int(scraping_cfg.get("context_pool_size", 1)),
+            int(scraping_cfg.get("concurrency", 8)),
+            1,
+        )
+        self._context_pool = asyncio.Queue()
+        for _ in range(pool_size):
+            self._context_pool.put_nowait(await self._new_context())
+        self.logger.info("Browser started with Tor proxy and %d pooled contexts", pool_size)
 
     async def stop(self) -> None:
-        """Close browser and playwright."""
-        if self._context:
-            await self._context.close()
-            self._context = None
-            self._page = None
+        """Close pooled contexts, browser and playwright."""
+        if self._context_pool:
+            while not self._context_pool.empty():
+                await self._context_pool.get_nowait().close()
+            self._context_pool = None
+            self._context_uses.clear()
+            self._consented.clear()
         if self._browser:
             await self._browser.close()
             self._browser = None
@@ -72,67 +147,147 @@ class Browser:
             self._playwright = None
         self.logger.info("Browser stopped")
 
-    @property
-    def page(self) -> Page:
-        """Return current page; raises if browser not started."""
-        if self._page is None:
+    def _require_pool(self) -> asyncio.Queue[BrowserContext]:
+        """Return the context pool; raises if browser not started."""
+        if self._context_pool is None:
             raise RuntimeError("Browser not started. Call start() first.")
-        return self._page
+        return self._context_pool
 
-    async def navigate_to_form(self) -> None:
-        """Load the CNMC portability checker page and dismiss cookie consent."""
-        base_url = str(self.config.get("scraping", {}).get(
-            "base_url", "https://numeracionyoperadores.cnmc.es/portabilidad/movil"
-        ))
-        self.logger.info("Navigating to %s", base_url)
-        await self.page.goto(base_url, wait_until="networkidle")
-        # Dismiss cookie consent dialog if present
+    @asynccontextmanager
+    async def new_page(self) -> AsyncIterator[Page]:
+        """Borrow a pooled context and yield a fresh page on it.
+
+        On clean exit the context goes back to the pool with cookies cleared
+        (the cached consent cookies are restored).
+        If the body raises (or is cancelled), the context is discarded and
+        replaced so a blocked fingerprint is not reused. Either way the pool
+        always gets a context back.
+        """
+        pool = self._require_pool()
+        context = await pool.get()
+        reusable = False
         try:
-            acepto = self.page.locator('button:has-text("Acepto")')
-            await acepto.click(timeout=3000)
-            await self.page.wait_for_timeout(500)
-            self.logger.info("Cookie consent dismissed")
-        except Exception:
-            pass
+            page = await context.new_page()
+            try:
+                await self._block_requests(page)
+                yield page
+            finally:
+                await page.close()
+            self._context_uses[context] += 1
+            if self._context_uses[context] < self._context_max_pages:
+                await context.clear_cookies()
+                if self._storage_state is not None:
+                    await context.add_cookies(list(self._storage_state.get("cookies", [])))  # type: ignore[arg-type]
+                reusable = True
+        finally:
+            if reusable:
+                pool.put_nowait(context)
+            else:
+                await self._replace_context(context)
+
+    async def navigate_to_form(self, page: Page) -> None:
+        """Load the CNMC portability checker page, dismissing cookie consent once per context."""
+        self.logger.info("Navigating to %s", self.base_url)
+        await page.goto(self.base_url, wait_until="domcontentloaded")
+        context = page.context
+        if context not in self._consented:
+            # Dismiss cookie consent dialog if present
+            try:
+                before = await context.cookies()
+                acepto = page.locator('button:has-text("Acepto")')
+                await acepto.click(timeout=3000)
+                # Only a dismissed dialog counts; otherwise the next page retries
+                self._consented.add(context)
+                await page.wait_for_timeout(500)
+                self.logger.info("Cookie consent dismissed")
+                if self._storage_state is None:
+                    self._storage_state = self._consent_state(await context.storage_state(), before)
+            except Exception:
+                pass
         self.logger.info("CNMC form page loaded")
 
-    async def fill_phone(self, phone: str) -> None:
+    def _consent_state(self, state: StorageState, before: list[Cookie]) -> StorageState:
+        """Reduce a storage state to what the consent click set on the CNMC site.
+
+        Session and reCAPTCHA cookies are dropped so contexts seeded from it do
+        not share one identity.
+        """
+        base = urlsplit(self.base_url)
+        host = base.hostname or ""
+        origin = f"{base.scheme}://{base.netloc}"
+
+        def key(c: Cookie | StorageStateCookie) -> tuple[str | None, ...]:
+            return (c.get("name"), c.get("domain"), c.get("path"), c.get("value"))
+
+        seen = {key(c) for c in before}
+
+        def on_cnmc(domain: str) -> bool:
+            domain = domain.lstrip(".")
+            return host == domain or host.endswith("." + domain)
+
+        cookies = [
+            c for c in state.get("cookies", [])
+            if on_cnmc(c.get("domain", "")) and key(c) not in seen
+        ]
+        origins = [o for o in state.get("origins", []) if o.get("origin") == origin]
+        return {"cookies": cookies, "origins": origins}
+
+    async def fill_phone(self, page: Page, phone: str) -> None:
         """Enter phone number into the CNMC Vuetify form input field."""
         input_selector = "input.v-field__input"
-        await self.page.wait_for_selector(input_selector)
-        await self.page.locator(input_selector).first.fill(phone)
+        await page.wait_for_selector(input_selector)
+        await page.locator(input_selector).first.fill(phone)
         self.logger.info("Filled phone: %s", phone)
 
-    async def submit_form(self) -> None:
+    async def submit_form(self, page: Page) -> None:
         """Click the Buscar button on the CNMC form."""
         submit_selector = 'button.v-btn.bg-warning:has-text("Buscar")'
-        await self.page.locator(submit_selector).click()
+        await page.locator(submit_selector).click()
         self.logger.info("Form submitted")
 
-    async def get_response_html(self) -> str:
+    async def get_response_html(self, page: Page) -> str:
         """Wait for result card and return the result column HTML."""
         try:
-            await self.page.wait_for_selector(
+            await page.wait_for_selector(
                 ".v-col-lg-8 .v-card",
                 timeout=30000,
             )
         except Exception:
             self.logger.warning("Result card not found; returning full page HTML")
-        return await self.page.locator(".v-col-lg-8").inner_html()
+        return await page.locator(".v-col-lg-8").inner_html()
 
-    async def rotate_user_agent(self) -> None:
-        """Create a new context+page with a fresh user agent (call after IP rotation)."""
-        old_page = self._page
-        old_ctx = self._context
-        user_agent = random.choice(USER_AGENTS)
-        if self._browser is None:
-            raise RuntimeError("Browser not started")
-        timeout_ms = int(self.config.get("scraping", {}).get("page_load_timeout_ms", 60000))
-        self._context = await self._browser.new_context(user_agent=user_agent)
-        self._context.set_default_timeout(timeout_ms)
-        page = await self._context.new_page()
-        await page.add_init_script(WEBDRIVER_MASK_SCRIPT)
-        self._page = page
-        if old_ctx:
-            await old_ctx.close()
-        self.logger.info("Rotated user agent: %s", user_agent[:40])
+    async def rotate_all_contexts(self) -> None:
+        """Replace every pooled context, e.g. after a Tor IP change.
+
+        Call with no pages in flight: idle contexts keep keep-alive connections
+        on the old circuit, so none of them may serve the new IP.
+        """
+        pool = self._require_pool()
+        idle = [pool.get_nowait() for _ in range(pool.qsize())]
+        try:
+            while idle:
+                await self._replace_context(idle.pop())
+        finally:
+            for context in idle:
+                pool.put_nowait(context)
+
+    async def _replace_context(self, context: BrowserContext) -> None:
+        """Pool a fresh context in place of a checked-out one, then close the old one.
+
+        If the replacement cannot be created the old context goes back instead,
+        so a worker never waits forever on a pool that has shrunk.
+        """
+        pool = self._require_pool()
+        try:
+            fresh = await self._new_context()
+        except BaseException:
+            pool.put_nowait(context)
+            raise
+        pool.put_nowait(fresh)
+        self._context_uses.pop(context, None)
+        self._consented.discard(context)
+        try:
+            await context.close()
+        except Exception as e:
+            self.logger.warning("Failed to close rotated context: %s", e)
+        self.logger.info("Rotated browser context")
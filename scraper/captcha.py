@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import re
 
@@ -12,6 +13,64 @@ from twocaptcha import (
 
 from .utils import load_config, setup_logging
 
+# data-sitekey attribute | grecaptcha.render({sitekey: ...}) | anchor iframe k= param
+SITEKEY_RE = re.compile(
+    r'data-sitekey=["\']([^"\']+)["\']'
+    r"|grecaptcha\.render\([^,]+,\s*\{[^}]*sitekey['\"]?\s*:\s*['\"]([^'\"]+)['\"]"
+    r'|recaptcha/api2/anchor\?[^"]*k=([^&"]+)'
+)
+
+# Reads the sitekey in-page so the DOM is not serialized over CDP
+SITEKEY_JS = """() => {
+    const el = document.querySelector('[data-sitekey]');
+    if (el) return el.getAttribute('data-sitekey');
+    const frame = document.querySelector('iframe[src*="recaptcha/api2/anchor"]');
+    if (frame) return new URL(frame.src).searchParams.get('k');
+    return null;
+}"""
+
+# Defines window.__injectRecaptchaToken(token, path): sets g-recaptcha-response,
+# calls the callback at the cached key path under ___grecaptcha_cfg.clients,
+# otherwise walks the clients for callbacks. Returns the callback's key path.
+_INJECT_TOKEN_SRC = """
+window.__injectRecaptchaToken = function (token, path) {
+    const el = document.getElementById('g-recaptcha-response');
+    if (el) { el.style.display = ''; el.value = token; }
+    const ta = document.querySelector('textarea[name="g-recaptcha-response"]');
+    if (ta) { ta.style.display = ''; ta.value = token; }
+    if (typeof ___grecaptcha_cfg === 'undefined' || !___grecaptcha_cfg.clients) return null;
+    const clients = ___grecaptcha_cfg.clients;
+    if (path) {
+        const target = path.reduce((obj, key) => obj?.[key], clients);
+        if (typeof target?.callback === 'function') {
+            target.callback(token);
+            return path;
+        }
+    }
+    let found = null;
+    const seen = new Set();
+    const findCallback = (obj, trail) => {
+        if (!obj || typeof obj !== 'object' || seen.has(obj)) return;
+        seen.add(obj);
+        Object.keys(obj).forEach(k => {
+            const child = obj[k];
+            if (typeof child === 'object' && child !== null) {
+                if (typeof child.callback === 'function') {
+                    child.callback(token);
+                    if (!found) found = trail.concat(k);
+                }
+                findCallback(child, trail.concat(k));
+            }
+        });
+    };
+    findCallback(clients, []);
+    return found;
+};
+"""
+
+# Whitespace-collapsed once at import; registered per context via add_init_script
+INJECT_TOKEN_SCRIPT = " ".join(line.strip() for line in _INJECT_TOKEN_SRC.strip().splitlines())
+
 
 class CaptchaSolver:
     def __init__(self, config: dict | None = None):
@@ -21,30 +80,32 @@ class CaptchaSolver:
         if not api_key:
             raise ValueError("2Captcha API key not set in config.yaml")
         self.solver = TwoCaptcha(apiKey=api_key)
+        # Key path under ___grecaptcha_cfg.clients to the widget callback
+        self._callback_path: list[str] | None = None
 
     async def detect_sitekey(self, page: Page) -> str | None:
-        """Extract reCAPTCHA sitekey from page HTML."""
+        """Extract reCAPTCHA sitekey from the page DOM, falling back to the raw HTML."""
+        sitekey = await page.evaluate(SITEKEY_JS)
+        if sitekey:
+            return str(sitekey)
+        # grecaptcha.render() configs only show up in inline script text
         html = await page.content()
-        # Look for data-sitekey attribute
-        match = re.search(r'data-sitekey=["\']([^"\']+)["\']', html)
-        if match:
-            return match.group(1)
-        # Look for sitekey in grecaptcha.render call
-        match = re.search(r"grecaptcha\.render\([^,]+,\s*\{[^}]*sitekey['\"]?\s*:\s*['\"]([^'\"]+)['\"]", html)
-        if match:
-            return match.group(1)
-        # Look for sitekey in recaptcha iframe src (k= parameter)
-        match = re.search(r'recaptcha/api2/anchor\?[^"]*k=([^&"]+)', html)
+        # Single pass over the HTML for all three sitekey locations
+        match = SITEKEY_RE.search(html)
         if match:
-            return match.group(1)
+            return next(group for group in match.groups() if group)
         self.logger.error("Could not detect reCAPTCHA sitekey on page")
         return None
 
-    def solve(self, sitekey: str, page_url: str) -> str | None:
-        """Send solve request to 2Captcha and return token."""
+    async def solve(self, sitekey: str, page_url: str) -> str | None:
+        """Send solve request to 2Captcha and return token.
+
+        The SDK call blocks while polling for the answer, so it runs in a worker
+        thread to keep other phones scraping in the meantime.
+        """
         try:
             self.logger.info("Sending captcha to 2Captcha...")
-            result = self.solver.recaptcha(sitekey=sitekey, url=page_url)
+            result = await asyncio.to_thread(self.solver.recaptcha, sitekey=sitekey, url=page_url)
             if result is None:
                 self.logger.error("2Captcha returned empty result")
                 return None
@@ -62,36 +123,18 @@ class CaptchaSolver:
         return None
 
     async def inject_token(self, page: Page, token: str) -> None:
-        """Set g-recaptcha-response and trigger the reCAPTCHA callback."""
-        await page.evaluate(
-            """(token) => {
-                const el = document.getElementById('g-recaptcha-response');
-                if (el) { el.style.display = ''; el.value = token; }
-                const ta = document.querySelector('textarea[name="g-recaptcha-response"]');
-                if (ta) { ta.style.display = ''; ta.value = token; }
+        """Set g-recaptcha-response and trigger the reCAPTCHA callback.
 
-                // Walk ___grecaptcha_cfg clients to find and invoke callback
-                if (typeof ___grecaptcha_cfg !== 'undefined') {
-                    const clients = ___grecaptcha_cfg.clients;
-                    if (clients) {
-                        Object.keys(clients).forEach(key => {
-                            const client = clients[key];
-                            const findCallback = (obj) => {
-                                if (!obj || typeof obj !== 'object') return;
-                                Object.keys(obj).forEach(k => {
-                                    if (typeof obj[k] === 'object' && obj[k] !== null) {
-                                        if (typeof obj[k].callback === 'function') {
-                                            obj[k].callback(token);
-                                        }
-                                        findCallback(obj[k]);
-                                    }
-                                });
-                            };
-                            findCallback(client);
-                        });
-                    }
-                }
-            }""",
-            token,
+        The first call walks ``___grecaptcha_cfg.clients`` to find the callback
+        and remembers its key path; later calls invoke it directly and only walk
+        again if the cached path no longer resolves. The page must have
+        INJECT_TOKEN_SCRIPT installed (Browser adds it to every context).
+        """
+        path = await page.evaluate(
+            "([token, path]) => window.__injectRecaptchaToken(token, path)",
+            [token, self._callback_path],
         )
+        if path and path != self._callback_path:
+            self.logger.info("reCAPTCHA callback found at clients.%s", ".".join(path))
+        self._callback_path = path or None
         self.logger.info("Captcha token injected into page")
@@ -1,26 +1,33 @@
 """CSV reader with phone number validation for Spanish mobile numbers."""
 import logging
-import re
+import mmap
+from array import array
 from pathlib import Path
 
 from .utils import load_config
 
 logger = logging.getLogger("cnmc_scraper")
 
-SPANISH_MOBILE_RE = re.compile(r"^[67]\d{8}$")
 
+def is_spanish_mobile(raw: bytes) -> bool:
+    """Return True for a 9-digit number starting with 6 or 7."""
+    # Cheaper than a regex match for a fixed-length numeric string;
+    # bytes.isdigit() only accepts ASCII digits
+    return len(raw) == 9 and raw[0] in b"67" and raw.isdigit()
 
-def read_phones(input_path: str | None = None) -> list[str]:
+
+def read_phones(input_path: str | None = None, config: dict | None = None) -> list[str]:
     """Read and validate phone numbers from a single-column CSV.
 
     Args:
         input_path: Path to CSV file. Falls back to config.yaml input_csv.
+        config: Loaded config; read from config.yaml if omitted.
 
     Returns:
         Deduplicated list of valid 9-digit Spanish mobile numbers.
     """
     if input_path is None:
-        config = load_config()
+        config = config or load_config()
         input_path = str(config.get("input_csv", "phones.csv"))
 
     path = Path(input_path)
@@ -28,21 +35,31 @@ def read_phones(input_path: str | None = None) -> list[str]:
         logger.error(f"Input CSV not found: {input_path}")
         return []
 
-    seen: set[str] = set()
-    phones: list[str] = []
-
-    with open(path, "r") as f:
-        for line in f:
-            raw = line.strip()
-            if not raw:
-                continue
-            if not SPANISH_MOBILE_RE.match(raw):
-                logger.warning(f"Skipping invalid phone: {raw}")
-                continue
-            if raw in seen:
-                continue
-            seen.add(raw)
-            phones.append(raw)
+    # Phones fit in 32 bits; keep them as ints until the list[str] boundary
+    seen: set[int] = set()
+    numbers = array("I")
+
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            data = None
+        if data is not None:
+            with data:
+                for line in iter(data.readline, b""):
+                    raw = line.strip()
+                    if not raw:
+                        continue
+                    if not is_spanish_mobile(raw):
+                        logger.warning(f"Skipping invalid phone: {raw.decode(errors='replace')}")
+                        continue
+                    number = int(raw)
+                    if number in seen:
+                        continue
+                    seen.add(number)
+                    numbers.append(number)
 
+    phones = [str(n) for n in numbers]
     logger.info(f"Loaded {len(phones)} valid phone numbers from {input_path}")
     return phones
@@ -1,27 +1,78 @@
 import sqlite3
+import time
+from collections.abc import Iterable
 from datetime import datetime, timezone
 from typing import Optional
 
 from .utils import load_config
 
+# Fixed statement text so sqlite3's per-connection statement cache reuses the plans
+UPSERT_RESULT_SQL = """INSERT INTO portability (phone, operator, query_date, scraped_at)
+   VALUES (?, ?, ?, ?)
+   ON CONFLICT(phone) DO UPDATE SET
+     operator = excluded.operator,
+     query_date = excluded.query_date,
+     scraped_at = excluded.scraped_at"""
+
+SELECT_PROGRESS_SQL = "SELECT last_line FROM progress WHERE csv_file = ?"
+
+# Rebuilds a portability table from before scraped_at became epoch milliseconds:
+# ISO-8601 strings are converted, digit strings (epoch ms stored with TEXT
+# affinity) are cast, anything unparseable becomes NULL
+MIGRATE_SCRAPED_AT_SQL = """
+BEGIN;
+CREATE TABLE portability_new (
+    phone TEXT PRIMARY KEY,
+    operator TEXT,
+    query_date TEXT,
+    scraped_at INTEGER
+);
+INSERT INTO portability_new (phone, operator, query_date, scraped_at)
+SELECT phone, operator, query_date,
+    CASE
+        WHEN scraped_at IS NULL OR typeof(scraped_at) IN ('integer', 'real')
+            THEN CAST(scraped_at AS INTEGER)
+        WHEN scraped_at <> '' AND scraped_at NOT GLOB '*[^0-9]*'
+            THEN CAST(scraped_at AS INTEGER)
+        ELSE CAST(round((julianday(scraped_at) - 2440587.5) * 86400000) AS INTEGER)
+    END
+FROM portability;
+DROP TABLE portability;
+ALTER TABLE portability_new RENAME TO portability;
+COMMIT;
+"""
+
+UPSERT_PROGRESS_SQL = """INSERT INTO progress (csv_file, last_line, updated_at)
+   VALUES (?, ?, ?)
+   ON CONFLICT(csv_file) DO UPDATE SET
+     last_line = excluded.last_line,
+     updated_at = excluded.updated_at"""
+
 
 class Database:
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(self, db_path: Optional[str] = None, config: dict | None = None):
         if db_path is None:
-            config = load_config()
+            config = config or load_config()
             db_path = str(config.get("database", {}).get("path", "cnmc.db"))
         self.db_path: str = db_path
-        self.conn = sqlite3.connect(self.db_path)
+        # Writes are offloaded to a worker thread; callers serialize access
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
         self.conn.row_factory = sqlite3.Row
         self._create_tables()
 
     def _create_tables(self) -> None:
         self.conn.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            PRAGMA temp_store = MEMORY;
+            PRAGMA mmap_size = 268435456;
+            PRAGMA cache_size = -65536;
+
             CREATE TABLE IF NOT EXISTS portability (
                 phone TEXT PRIMARY KEY,
                 operator TEXT,
                 query_date TEXT,
-                scraped_at TEXT
+                scraped_at INTEGER
             );
 
             CREATE TABLE IF NOT EXISTS progress (
@@ -31,37 +82,50 @@ class Database:
             );
         """)
         self.conn.commit()
+        self._migrate_scraped_at()
 
-    def upsert_result(self, phone: str, operator: str, query_date: str) -> None:
-        now = datetime.now(timezone.utc).isoformat()
-        self.conn.execute(
-            """INSERT INTO portability (phone, operator, query_date, scraped_at)
-               VALUES (?, ?, ?, ?)
-               ON CONFLICT(phone) DO UPDATE SET
-                 operator = excluded.operator,
-                 query_date = excluded.query_date,
-                 scraped_at = excluded.scraped_at""",
-            (phone, operator, query_date, now),
-        )
-        self.conn.commit()
+    def _migrate_scraped_at(self) -> None:
+        """Convert a database created with scraped_at TEXT (ISO strings) to epoch ms."""
+        columns = {row["name"]: row["type"] for row in self.conn.execute("PRAGMA table_info(portability)")}
+        if columns.get("scraped_at", "").upper() == "INTEGER":
+            return
+        try:
+            self.conn.executescript(MIGRATE_SCRAPED_AT_SQL)
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    def save_batch(self, rows: Iterable[tuple[str, str, str]], csv_file: str, last_line: int) -> None:
+        """Upsert (phone, operator, query_date) rows and move progress to last_line
+        in one transaction (one fsync).
+
+        scraped_at is unix epoch milliseconds, sampled once for the whole batch.
+        """
+        # One clock read per batch stamps both the results and the progress row
+        now = time.time_ns() // 1_000_000
+        updated_at = datetime.fromtimestamp(now / 1000, timezone.utc).isoformat()
+        with self.conn:
+            self.conn.executemany(
+                UPSERT_RESULT_SQL,
+                [(phone, operator, query_date, now) for phone, operator, query_date in rows],
+            )
+            self.conn.execute(UPSERT_PROGRESS_SQL, (csv_file, last_line, updated_at))
+
+    def done_phones(self) -> set[str]:
+        """Return every phone that already has a stored result."""
+        # Plain tuples: skip building a sqlite3.Row per stored phone
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        return {phone for (phone,) in cursor.execute("SELECT phone FROM portability")}
 
     def get_progress(self, csv_file: str) -> int:
-        cursor = self.conn.execute(
-            "SELECT last_line FROM progress WHERE csv_file = ?", (csv_file,)
-        )
+        cursor = self.conn.execute(SELECT_PROGRESS_SQL, (csv_file,))
         row = cursor.fetchone()
         return row["last_line"] if row else 0
 
     def update_progress(self, csv_file: str, last_line: int) -> None:
         now = datetime.now(timezone.utc).isoformat()
-        self.conn.execute(
-            """INSERT INTO progress (csv_file, last_line, updated_at)
-               VALUES (?, ?, ?)
-               ON CONFLICT(csv_file) DO UPDATE SET
-                 last_line = excluded.last_line,
-                 updated_at = excluded.updated_at""",
-            (csv_file, last_line, now),
-        )
+        self.conn.execute(UPSERT_PROGRESS_SQL, (csv_file, last_line, now))
         self.conn.commit()
 
     def close(self) -> None:
@@ -0,0 +1,49 @@
+"""Per-exit-IP query budget shared by the scraper workers."""
+import asyncio
+from collections.abc import Awaitable, Callable
+
+
+class IpBudget:
+    """Cap the queries sent from one exit IP and rotate once it is spent.
+
+    Every attempt is charged when it starts, so concurrent lookups cannot push
+    one IP past limit. Once the budget is spent no new query starts; the last
+    one in flight calls rotate before the waiting workers resume.
+    """
+
+    def __init__(self, limit: int, rotate: Callable[[], Awaitable[bool]], stop: asyncio.Event):
+        """rotate returns False only if it gave up because a stop was requested."""
+        self.limit = max(1, limit)
+        self._rotate = rotate
+        self._stop = stop
+        self._queries = 0
+        self._in_flight = 0
+        self._cond = asyncio.Condition()
+
+    @property
+    def queries(self) -> int:
+        """Queries charged to the current IP."""
+        return self._queries
+
+    async def claim(self) -> bool:
+        """Wait for room in the current IP's budget; False if stopping instead."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._queries < self.limit or self._stop.is_set())
+            if self._stop.is_set():
+                return False
+            self._queries += 1
+            self._in_flight += 1
+            return True
+
+    async def release(self) -> None:
+        """Finish a claimed query; the last one out of a spent budget rotates."""
+        async with self._cond:
+            self._in_flight -= 1
+            if self._in_flight == 0 and self._queries >= self.limit:
+                if await self._rotate():
+                    self._queries = 0
+                self._cond.notify_all()
+
+    def spend(self) -> None:
+        """Start no more queries on the current IP; rotate once in-flight ones finish."""
+        self._queries = max(self._queries, self.limit)
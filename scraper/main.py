@@ -3,161 +3,338 @@
 import argparse
 import asyncio
 import logging
+import random
 import signal
+import sqlite3
+import time
+from dataclasses import replace
 
 from .browser import Browser
 from .captcha import CaptchaSolver
 from .csv_reader import read_phones
 from .database import Database
-from .parser import parse_result
-from .proxy_pool import ProxyPool
+from .ip_budget import IpBudget
+from .parser import PortabilityResult, parse_result
+from .progress import ProgressWatermark
+from .proxy_pool import ProxyPool, Rotation
 from .utils import load_config, setup_logging
 
 logger = logging.getLogger("cnmc_scraper")
 
 MAX_RETRIES = 3
+DB_BUSY_RETRIES = 3
 
 
-class GracefulExit(Exception):
-    """Raised on SIGINT to trigger graceful shutdown."""
+def _install_stop_handler(loop: asyncio.AbstractEventLoop, task: asyncio.Task) -> asyncio.Event:
+    """Install a SIGINT handler on the loop and return the stop event it sets.
 
+    The first Ctrl-C sets the event; a second cancels task and removes the
+    handler, so a third falls back to Python's KeyboardInterrupt.
+    """
+    stop = asyncio.Event()
+
+    def handler() -> None:
+        if stop.is_set():
+            logger.info("SIGINT received again, cancelling in-flight lookups...")
+            loop.remove_signal_handler(signal.SIGINT)
+            task.cancel()
+            return
+        logger.info("SIGINT received, finishing in-flight lookups (Ctrl+C again to abort)...")
+        stop.set()
 
-def _setup_signal_handler() -> None:
-    """Install SIGINT handler that raises GracefulExit."""
-    def handler(_sig: int, _frame: object) -> None:
-        logger.info("SIGINT received, shutting down gracefully...")
-        raise GracefulExit()
-    signal.signal(signal.SIGINT, handler)
+    loop.add_signal_handler(signal.SIGINT, handler)
+    return stop
 
 
 async def _process_phone(
     phone: str,
     browser: Browser,
     captcha_solver: CaptchaSolver,
-    config: dict,
-) -> dict[str, str] | None:
+) -> PortabilityResult | None:
     """Navigate form, solve captcha, submit, parse result for one phone.
 
-    Returns parsed dict or None on failure.
+    Returns parsed result or None on failure.
     """
-    base_url = str(config.get("scraping", {}).get(
-        "base_url", "https://numeracionyoperadores.cnmc.es/portabilidad/movil"
-    ))
-
-    await browser.navigate_to_form()
-    await browser.fill_phone(phone)
-
-    # Detect and solve captcha
-    sitekey = await captcha_solver.detect_sitekey(browser.page)
-    if sitekey:
-        token = captcha_solver.solve(sitekey, base_url)
-        if token is None:
-            raise RuntimeError("Captcha solve failed")
-        await captcha_solver.inject_token(browser.page, token)
-
-    await browser.submit_form()
-    html = await browser.get_response_html()
+    async with browser.new_page() as page:
+        await browser.navigate_to_form(page)
+        await browser.fill_phone(page, phone)
+
+        # Detect and solve captcha
+        sitekey = await captcha_solver.detect_sitekey(page)
+        if sitekey:
+            token = await captcha_solver.solve(sitekey, browser.base_url)
+            if token is None:
+                raise RuntimeError("Captcha solve failed")
+            await captcha_solver.inject_token(page, token)
+
+        await browser.submit_form(page)
+        html = await browser.get_response_html(page)
     return parse_result(html)
 
 
 async def run(config: dict, input_path: str | None, reset: bool) -> None:
-    """Main async orchestration loop."""
-    _setup_signal_handler()
+    """Main async orchestration loop.
 
-    db = Database()
-    phones = read_phones(input_path)
-    if not phones:
-        logger.error("No valid phones to process")
-        db.close()
-        return
-
-    csv_file = input_path or str(config.get("input_csv", "phones.csv"))
-    start_line = 0
-    if reset:
-        db.update_progress(csv_file, 0)
-        logger.info("Progress reset for %s", csv_file)
-    else:
-        start_line = db.get_progress(csv_file)
-        if start_line > 0:
-            logger.info("Resuming from line %d for %s", start_line, csv_file)
-
-    proxy_pool = ProxyPool(config)
-    proxy_pool.connect()
-
-    captcha_solver = CaptchaSolver(config)
-    browser = Browser(config)
-    await browser.start()
-
-    delay = float(config.get("scraping", {}).get("delay_seconds", 2))
-    retry_cfg = config.get("retry", {})
-    max_retries = int(retry_cfg.get("max_attempts", MAX_RETRIES))
-    base_delay = float(retry_cfg.get("base_delay_seconds", 5))
-
-    success_count = 0
-    fail_count = 0
-    skip_count = start_line
-    last_idx = start_line
+    Ctrl-C first lets in-flight lookups finish; a second Ctrl-C cancels them.
+    Buffered results and progress are saved either way.
+    """
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    assert task is not None
+    stop = _install_stop_handler(loop, task)
+    try:
+        await _run(config, input_path, reset, stop)
+    except asyncio.CancelledError:
+        if not stop.is_set():
+            raise
+        # Our own second-SIGINT cancel; _run has already saved what it had
+        task.uncancel()
+        logger.info("Aborted; in-flight lookups were cancelled")
+    finally:
+        loop.remove_signal_handler(signal.SIGINT)
+
+
+async def _run(config: dict, input_path: str | None, reset: bool, stop: asyncio.Event) -> None:
+    """Look up every unfinished phone of the CSV and store the results.
 
+    A fixed pool of workers shares the phone list, an IpBudget paces queries
+    per Tor exit IP and a ProgressWatermark decides which line is saved with
+    each batch. Returns early, saving what it has, once stop is set.
+    """
+    db = Database(config=config)
+    browser: Browser | None = None
     try:
-        for idx, phone in enumerate(phones):
-            if idx < start_line:
-                continue
-            last_idx = idx
+        phones = read_phones(input_path, config)
+        if not phones:
+            logger.error("No valid phones to process")
+            return
+
+        csv_file = input_path or str(config.get("input_csv", "phones.csv"))
+        start_line = 0
+        done: set[str] = set()
+        if reset:
+            db.update_progress(csv_file, 0)
+            logger.info("Progress reset for %s", csv_file)
+        else:
+            start_line = db.get_progress(csv_file)
+            if start_line > 0:
+                logger.info("Resuming from line %d for %s", start_line, csv_file)
+            # Phones already stored (e.g. in flight past the saved line) are not re-queried
+            done = db.done_phones()
+
+        progress = ProgressWatermark(len(phones), start_line)
+        work: list[tuple[int, str]] = []
+        for idx in range(start_line, len(phones)):
+            phone = phones[idx]
+            if phone in done:
+                progress.mark_done(idx)
+            else:
+                work.append((idx, phone))
+
+        # Startup checks for Ctrl-C between steps; there is nothing to save yet
+        if stop.is_set():
+            return
+        proxy_pool = ProxyPool(config)
+        await asyncio.to_thread(proxy_pool.connect)
+        if stop.is_set():
+            return
+
+        captcha_solver = CaptchaSolver(config)
+        browser = Browser(config)
+        await browser.start()
+        if stop.is_set():
+            return
+
+        # Config is read once up front; the worker loop only touches locals
+        scraping_cfg = config.get("scraping", {})
+        delay = float(scraping_cfg.get("delay_seconds", 2))
+        concurrency = max(1, int(scraping_cfg.get("concurrency", 8)))
+        retry_cfg = config.get("retry", {})
+        max_retries = int(retry_cfg.get("max_attempts", MAX_RETRIES))
+        base_delay = float(retry_cfg.get("base_delay_seconds", 5))
+        circuit_threshold = max(1, int(retry_cfg.get("circuit_threshold", 20)))
+        circuit_cooldown = float(retry_cfg.get("circuit_cooldown_seconds", 60))
+        batch_size = max(1, int(config.get("database", {}).get("batch_size", 100)))
+
+        success_count = 0
+        fail_count = 0
+        # Circuit breaker: consecutive phones that exhausted their retries
+        fail_streak = 0
+        circuit_open_until = 0.0
+        skip_count = len(phones) - len(work)
+
+        # Results are written in batches; progress is saved with them so it never
+        # runs ahead of what is actually on disk
+        pending: list[PortabilityResult] = []
+        unflushed = 0
+        db_lock = asyncio.Lock()
+        # Strong references to in-flight batch writes (see flush)
+        writes: set[asyncio.Task[None]] = set()
+
+        def write_batch(results: list[PortabilityResult], line: int) -> None:
+            # Runs in a worker thread, so blocking backoff is fine here
+            rows = [(r.phone, r.operator, r.query_date) for r in results]
+            for attempt in range(1, DB_BUSY_RETRIES + 1):
+                try:
+                    db.save_batch(rows, csv_file, line)
+                    return
+                except sqlite3.OperationalError as e:
+                    if e.sqlite_errorcode != sqlite3.SQLITE_BUSY or attempt == DB_BUSY_RETRIES:
+                        raise
+                    logger.warning("Database busy, retrying batch write (%d/%d)", attempt, DB_BUSY_RETRIES)
+                    time.sleep(0.5 * attempt)
+
+        async def write_locked(batch: list[PortabilityResult], line: int) -> None:
+            async with db_lock:
+                try:
+                    await asyncio.to_thread(write_batch, batch, line)
+                except Exception:
+                    # Put the rows back so the next flush (at the latest the final
+                    # one) stores them before any progress past their lines
+                    pending[:0] = batch
+                    raise
+
+        async def flush() -> None:
+            """Write buffered results and progress off the event loop."""
+            nonlocal unflushed
+            batch, line = pending[:], progress.line
+            pending.clear()
+            unflushed = 0
+            # The write runs as its own task holding db_lock until the thread is done:
+            # cancelling the caller must not let the final flush or db.close() reach
+            # the connection while the thread is still writing
+            task = asyncio.create_task(write_locked(batch, line))
+            writes.add(task)
+            task.add_done_callback(writes.discard)
+            await asyncio.shield(task)
+
+        async def stop_requested(timeout: float) -> bool:
+            """Sleep up to timeout seconds; True as soon as a stop is requested."""
+            try:
+                await asyncio.wait_for(stop.wait(), timeout)
+            except TimeoutError:
+                return False
+            return True
+
+        async def rotate_ip() -> bool:
+            """Send NEWNYM (waiting out Tor's minimum interval) and refresh all contexts.
+
+            Pooled contexts are recycled because their keep-alive sockets ride
+            the old circuit.
+
+            Returns False only if a stop was requested while waiting. If the
+            control port fails the current IP is kept, as before the budget.
+            """
+            # Tor control I/O blocks, so keep it off the loop
+            while (outcome := await asyncio.to_thread(proxy_pool.force_rotate)) is Rotation.TOO_SOON:
+                if await stop_requested(1):
+                    return False
+            if outcome is Rotation.FAILED:
+                logger.warning("Tor IP rotation failed; continuing on the current IP")
+                return True
+            await browser.rotate_all_contexts()
+            return True
+
+        ip_budget = IpBudget(proxy_pool.rotation_count, rotate_ip, stop)
+
+        async def scrape_one(idx: int, phone: str) -> None:
+            nonlocal success_count, fail_count, unflushed, fail_streak, circuit_open_until
+            # While the circuit is open every worker waits instead of hammering CNMC
+            pause = circuit_open_until - time.monotonic()
+            if pause > 0 and await stop_requested(pause):
+                return
 
             retries = 0
             succeeded = False
 
             while retries < max_retries and not succeeded:
+                if not await ip_budget.claim():
+                    # Stopping: leave the phone unfinished so a resumed run retries it
+                    return
+                error: Exception | None = None
+                blocked = False
                 try:
-                    result = await _process_phone(phone, browser, captcha_solver, config)
-                    if result:
-                        db.upsert_result(result["phone"] or phone, result["operator"], result["query_date"])
-                        logger.info("[%d/%d] %s -> %s", idx + 1, len(phones), phone, result["operator"])
-                        succeeded = True
-                        success_count += 1
-                    else:
+                    result = await _process_phone(phone, browser, captcha_solver)
+                    if not result:
                         raise RuntimeError("Parse returned None")
-                except GracefulExit:
-                    raise
                 except Exception as e:
-                    retries += 1
-                    is_captcha_or_block = "captcha" in str(e).lower() or "block" in str(e).lower()
-                    if is_captcha_or_block:
-                        logger.warning("Captcha/block failure for %s, rotating IP: %s", phone, e)
-                        proxy_pool.force_rotate()
-                        await browser.rotate_user_agent()
-                    elif retries < max_retries:
-                        wait = base_delay * (2 ** (retries - 1))
-                        logger.warning("Retry %d/%d for %s: %s (wait %.0fs)", retries, max_retries, phone, e, wait)
-                        await asyncio.sleep(wait)
-                    else:
-                        logger.error("All %d retries failed for %s: %s", max_retries, phone, e)
-
-            if not succeeded:
-                fail_count += 1
+                    error = e
+                    blocked = "captcha" in str(e).lower() or "block" in str(e).lower()
+                    if blocked:
+                        ip_budget.spend()
+                else:
+                    # Recorded before the slot is released, which may wait on a rotation
+                    if not result.phone:
+                        result = replace(result, phone=phone)
+                    pending.append(result)
+                    logger.info("[%d/%d] %s -> %s", idx + 1, len(phones), phone, result.operator)
+                    succeeded = True
+                    success_count += 1
+                finally:
+                    await ip_budget.release()
+
+                if succeeded:
+                    continue
+
+                retries += 1
+                if blocked:
+                    # The failed page's context was already replaced by new_page();
+                    # the retry waits in ip_budget.claim() for the new IP
+                    logger.warning("Captcha/block failure for %s, rotating IP: %s", phone, error)
+                elif retries < max_retries:
+                    # Full jitter so concurrent workers do not retry in lockstep
+                    wait = random.uniform(0, base_delay * (2 ** (retries - 1)))
+                    logger.warning("Retry %d/%d for %s: %s (wait %.0fs)", retries, max_retries, phone, error, wait)
+                    if await stop_requested(wait):
+                        # Stopping: leave the phone unfinished so a resumed run retries it
+                        return
+                else:
+                    logger.error("All %d retries failed for %s: %s", max_retries, phone, error)
 
-            # Update progress after each phone
-            db.update_progress(csv_file, idx + 1)
-
-            # Rotate IP every N successful queries
             if succeeded:
-                rotated = proxy_pool.rotate_if_needed(success_count)
-                if rotated:
-                    await browser.rotate_user_agent()
-
-            # Delay between queries
-            if idx < len(phones) - 1:
-                await asyncio.sleep(delay)
-
-    except GracefulExit:
-        logger.info("Graceful shutdown: saving progress at line %d", last_idx + 1)
-        db.update_progress(csv_file, last_idx)
+                fail_streak = 0
+            else:
+                fail_count += 1
+                fail_streak += 1
+                if fail_streak >= circuit_threshold:
+                    # Exponent capped: an unbounded 2**n overflows float after ~1000 failures
+                    cooldown = min(circuit_cooldown, base_delay * 2 ** min(fail_streak - circuit_threshold, 16))
+                    circuit_open_until = max(circuit_open_until, time.monotonic() + cooldown)
+                    logger.warning("%d consecutive failures, pausing workers for %.0fs", fail_streak, cooldown)
+
+            progress.mark_done(idx)
+            unflushed += 1
+            if unflushed >= batch_size:
+                await flush()
+
+        # A fixed set of workers share one iterator, so memory stays flat however
+        # long the CSV is (instead of one pending task per phone)
+        work_iter = iter(work)
+
+        async def worker() -> None:
+            for idx, phone in work_iter:
+                if stop.is_set():
+                    return
+                await scrape_one(idx, phone)
+                # Delay between queries, per worker
+                if await stop_requested(delay):
+                    return
+
+        try:
+            async with asyncio.TaskGroup() as tg:
+                for _ in range(min(concurrency, len(work))):
+                    tg.create_task(worker())
+            if stop.is_set():
+                logger.info("Graceful shutdown: saving progress at line %d", progress.line)
+        finally:
+            await flush()
+
+        logger.info("Done. success=%d fail=%d skipped=%d total=%d", success_count, fail_count, skip_count, len(phones))
     finally:
-        await browser.stop()
+        if browser is not None:
+            await browser.stop()
         db.close()
 
-    logger.info("Done. success=%d fail=%d skipped=%d total=%d", success_count, fail_count, skip_count, len(phones))
-
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="CNMC Mobile Portability Scraper")
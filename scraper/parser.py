@@ -2,33 +2,82 @@
 
 import logging
 import re
+from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
 
-def parse_result(html: str) -> dict[str, str] | None:
+@dataclass(slots=True, frozen=True)
+class PortabilityResult:
+    """One parsed CNMC lookup."""
+
+    phone: str
+    operator: str
+    query_date: str
+
+
+# Field labels as they appear on the CNMC result card
+_LABEL_PATTERNS = {
+    "phone": re.compile(r"[Nn]úmero\s+de\s+teléfono", re.IGNORECASE),
+    "operator": re.compile(r"[Oo]perador\s+actual", re.IGNORECASE),
+    "query_date": re.compile(r"[Ff]echa\s+(?:de\s+)?consulta", re.IGNORECASE),
+}
+
+# Vuetify layout: <p class="negrita"> Label: </p><p>Value</p>, matched for all labels in one pass
+_VUETIFY_PAIR_RE = re.compile(
+    r'<p[^>]*class="negrita"[^>]*>\s*([^<]*)</p>\s*<p>([^<]+)</p>',
+    re.IGNORECASE,
+)
+
+# Fallback "Label: value" layout
+_FIELD_PHONE_RE = re.compile(r"[Nn]úmero\s+de\s+teléfono[^<]*?[>:]\s*([^<\n]+)")
+_FIELD_OPERATOR_RE = re.compile(r"[Oo]perador\s+actual[^<]*?[>:]\s*([^<\n]+)")
+_FIELD_DATE_RE = re.compile(r"[Ff]echa\s+(?:de\s+)?consulta[^<]*?[>:]\s*([^<\n]+)")
+
+
+def _table_field_re(label_pattern: str) -> re.Pattern[str]:
+    return re.compile(
+        r"<t[dh][^>]*>[^<]*" + label_pattern + r"[^<]*</t[dh]>\s*"
+        r"<td[^>]*>\s*([^<]+?)\s*</td>",
+        re.IGNORECASE | re.DOTALL,
+    )
+
+
+# Fallback table layout: <td>label</td><td>value</td>
+_TABLE_PHONE_RE = _table_field_re(r"[Nn]úmero\s+de\s+teléfono")
+_TABLE_OPERATOR_RE = _table_field_re(r"[Oo]perador\s+actual")
+_TABLE_DATE_RE = _table_field_re(r"[Ff]echa\s+(?:de\s+)?consulta")
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+# Every layout labels its fields with these stems; str.find for them is far
+# cheaper than the field regexes, which then only run from the earliest one on.
+# Stems as the card spells them; other casings fall back to a whole-page parse
+_FIELD_MARKERS = ("eléfono", "perador", "echa")
+# Room before the first label for the opening tag(s) the field regexes expect
+_MARKER_MARGIN = 512
+
+# Error/alert element text | "Error: ..." | "No se ha encontrado ..."
+_ERROR_RE = re.compile(
+    r'class="[^"]*(?:error|alert)[^"]*"[^>]*>(?P<cls>[^<]+)<'
+    r"|[Ee]rror[:\s]+(?P<msg>[^<\n]+)"
+    r"|(?P<notfound>[Nn]o\s+se\s+ha\s+encontrado[^<\n]*)"
+)
+
+
+def parse_result(html: str) -> PortabilityResult | None:
     """
     Extract phone, operator, and query date from CNMC response HTML.
 
-    Returns dict with keys: phone, operator, query_date.
+    Returns a PortabilityResult (missing fields are empty strings).
     Returns None on parse failure.
     """
     try:
-        # Vuetify layout: <p class="negrita"> Label: </p><p>Value</p>
-        phone = _extract_vuetify_field(html, r"[Nn]úmero\s+de\s+teléfono")
-        operator = _extract_vuetify_field(html, r"[Oo]perador\s+actual")
-        query_date = _extract_vuetify_field(html, r"[Ff]echa\s+(?:de\s+)?consulta")
-
-        if not phone and not operator:
-            phone = _extract_field(html, r"[Nn]úmero\s+de\s+teléfono[^<]*?[>:]\s*([^<\n]+)")
-            operator = _extract_field(html, r"[Oo]perador\s+actual[^<]*?[>:]\s*([^<\n]+)")
-            query_date = _extract_field(html, r"[Ff]echa\s+(?:de\s+)?consulta[^<]*?[>:]\s*([^<\n]+)")
-
-        if not phone and not operator:
-            # Try table-based layout: <td>label</td><td>value</td>
-            phone = _extract_table_field(html, r"[Nn]úmero\s+de\s+teléfono")
-            operator = _extract_table_field(html, r"[Oo]perador\s+actual")
-            query_date = _extract_table_field(html, r"[Ff]echa\s+(?:de\s+)?consulta")
+        region = _field_region(html)
+        phone, operator, query_date = _extract_fields(region)
+        if not phone and not operator and len(region) < len(html):
+            # A label in another case (e.g. all caps) may sit before the region
+            phone, operator, query_date = _extract_fields(html)
 
         if not phone and not operator:
             # Check for error response
@@ -39,11 +88,11 @@ def parse_result(html: str) -> dict[str, str] | None:
                 logger.error("Failed to parse CNMC response: no phone or operator found")
             return None
 
-        result = {
-            "phone": (phone or "").strip(),
-            "operator": (operator or "").strip(),
-            "query_date": (query_date or "").strip(),
-        }
+        result = PortabilityResult(
+            phone=(phone or "").strip(),
+            operator=(operator or "").strip(),
+            query_date=(query_date or "").strip(),
+        )
         logger.debug("Parsed result: %s", result)
         return result
 
@@ -52,36 +101,69 @@ def parse_result(html: str) -> dict[str, str] | None:
         return None
 
 
-def _extract_vuetify_field(html: str, label_pattern: str) -> str | None:
-    """Extract value from Vuetify layout: <p class="negrita"> Label </p><p>Value</p>."""
-    pattern = (
-        r'<p[^>]*class="negrita"[^>]*>\s*' + label_pattern + r'[^<]*</p>\s*<p>([^<]+)</p>'
-    )
-    match = re.search(pattern, html, re.IGNORECASE | re.DOTALL)
-    if match:
-        value = match.group(1).strip()
-        return value if value else None
-    return None
-
-
-def _extract_field(html: str, pattern: str) -> str | None:
-    """Extract a field value using regex pattern."""
-    match = re.search(pattern, html)
+def _field_region(html: str) -> str:
+    """Return the HTML from just before the first field label, or all of it if none is found."""
+    start = len(html)
+    for marker in _FIELD_MARKERS:
+        # Only an earlier label can move the start, so stop searching there
+        pos = html.find(marker, 0, start + len(marker))
+        if pos != -1:
+            start = min(start, pos)
+    if start == len(html):
+        return html
+    return html[max(0, start - _MARKER_MARGIN):]
+
+
+def _extract_fields(html: str) -> tuple[str | None, str | None, str | None]:
+    """Try each known layout in turn; return (phone, operator, query_date)."""
+    fields = _extract_vuetify_fields(html)
+    phone = fields.get("phone")
+    operator = fields.get("operator")
+    query_date = fields.get("query_date")
+
+    if not phone and not operator:
+        phone = _extract_field(html, _FIELD_PHONE_RE)
+        operator = _extract_field(html, _FIELD_OPERATOR_RE)
+        query_date = _extract_field(html, _FIELD_DATE_RE)
+
+    if not phone and not operator:
+        # Try table-based layout: <td>label</td><td>value</td>
+        phone = _extract_table_field(html, _TABLE_PHONE_RE)
+        operator = _extract_table_field(html, _TABLE_OPERATOR_RE)
+        query_date = _extract_table_field(html, _TABLE_DATE_RE)
+
+    return phone, operator, query_date
+
+
+def _extract_vuetify_fields(html: str) -> dict[str, str]:
+    """Extract all known fields from the Vuetify label/value paragraphs in one scan."""
+    fields: dict[str, str] = {}
+    for match in _VUETIFY_PAIR_RE.finditer(html):
+        label = match.group(1)
+        value = match.group(2).strip()
+        if not value:
+            continue
+        for key, label_re in _LABEL_PATTERNS.items():
+            if key not in fields and label_re.match(label):
+                fields[key] = value
+                break
+    return fields
+
+
+def _extract_field(html: str, pattern: re.Pattern[str]) -> str | None:
+    """Extract a field value using a compiled regex pattern."""
+    match = pattern.search(html)
     if match:
         value = match.group(1).strip()
         # Remove any remaining HTML tags
-        value = re.sub(r"<[^>]+>", "", value).strip()
+        value = _TAG_RE.sub("", value).strip()
         return value if value else None
     return None
 
 
-def _extract_table_field(html: str, label_pattern: str) -> str | None:
+def _extract_table_field(html: str, pattern: re.Pattern[str]) -> str | None:
     """Extract value from table row: <td>label</td><td>value</td>."""
-    pattern = (
-        r"<t[dh][^>]*>[^<]*" + label_pattern + r"[^<]*</t[dh]>\s*"
-        r"<td[^>]*>\s*([^<]+?)\s*</td>"
-    )
-    match = re.search(pattern, html, re.IGNORECASE | re.DOTALL)
+    match = pattern.search(html)
     if match:
         value = match.group(1).strip()
         return value if value else None
@@ -89,16 +171,8 @@ def _extract_table_field(html: str, label_pattern: str) -> str | None:
 
 
 def _extract_error(html: str) -> str | None:
-    """Extract error message from CNMC response."""
-    # Common error patterns
-    patterns = [
-        r'class="[^"]*error[^"]*"[^>]*>([^<]+)<',
-        r'class="[^"]*alert[^"]*"[^>]*>([^<]+)<',
-        r"[Ee]rror[:\s]+([^<\n]+)",
-        r"[Nn]o\s+se\s+ha\s+encontrado[^<\n]*",
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, html)
-        if match:
-            return match.group(1).strip() if match.lastindex else match.group(0).strip()
+    """Extract error message from CNMC response in a single scan."""
+    match = _ERROR_RE.search(html)
+    if match:
+        return (match.group("cls") or match.group("msg") or match.group("notfound")).strip()
     return None
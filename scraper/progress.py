@@ -0,0 +1,24 @@
+"""Resume watermark over CSV lines that finish out of order."""
+
+
+class ProgressWatermark:
+    """Track finished CSV lines and the first line not yet finished.
+
+    Concurrent workers finish phones out of order; progress only advances past
+    lines whose phones (and all before them) are done, i.e. up to the first
+    unset bit.
+    """
+
+    def __init__(self, total: int, start_line: int = 0):
+        self.total = total
+        self.line = start_line
+        # One bit per CSV line, set once that phone is finished or already stored
+        self._bits = bytearray((total + 7) // 8)
+
+    def mark_done(self, idx: int) -> None:
+        """Mark line idx finished and advance the watermark past any finished run."""
+        self._bits[idx >> 3] |= 1 << (idx & 7)
+        line = self.line
+        while line < self.total and self._bits[line >> 3] & (1 << (line & 7)):
+            line += 1
+        self.line = line
@@ -1,6 +1,9 @@
-"""Tor-based proxy pool with counter-based IP rotation via stem."""
+"""Tor-based proxy pool with on-demand IP rotation via stem."""
 
+import atexit
+import enum
 import logging
+import threading
 import time
 
 from stem import Signal
@@ -13,6 +16,14 @@ logger = logging.getLogger(__name__)
 MIN_ROTATION_WAIT = 10  # Tor needs ~10s for new circuit after NEWNYM
 
 
+class Rotation(enum.Enum):
+    """Outcome of a rotation request."""
+
+    ROTATED = "rotated"
+    TOO_SOON = "too_soon"  # Within MIN_ROTATION_WAIT of the last one; retry later
+    FAILED = "failed"  # Control port error; retrying right away will not help
+
+
 class ProxyPool:
     def __init__(self, config: dict | None = None):
         if config is None:
@@ -28,51 +39,80 @@ class ProxyPool:
 
         self._last_rotation: float = 0.0
         self._query_counter: int = 0
+        # Rotations may be requested from several worker threads at once
+        self._rotate_lock = threading.Lock()
+        # Authenticated control connection, opened once and reused for every NEWNYM
+        self._ctrl: Controller | None = None
+        atexit.register(self.close)
 
     def connect(self) -> None:
-        """Verify Tor control port connectivity."""
+        """Open and authenticate the Tor control connection."""
         try:
-            with Controller.from_port(port=self.control_port) as ctrl:
-                ctrl.authenticate(password=self.control_password)
-                logger.info("Tor control port connected")
+            with self._rotate_lock:
+                self._get_ctrl()
+            logger.info("Tor control port connected")
         except Exception as e:
             logger.error(f"Cannot connect to Tor control port: {e}")
 
+    def close(self) -> None:
+        """Close the cached Tor control connection, if any."""
+        with self._rotate_lock:
+            self._drop_ctrl()
+
     def get_socks_proxy(self) -> str:
         """Return Tor SOCKS5 proxy URL for Playwright."""
         return f"socks5://{self.tor_host}:{self.tor_port}"
 
-    def rotate_if_needed(self, query_count: int) -> bool:
-        """Rotate IP if query_count is a multiple of rotation_count.
-
-        Returns True if rotation happened.
-        """
-        if query_count > 0 and query_count % self.rotation_count == 0:
-            self._rotate()
-            return True
-        return False
-
-    def force_rotate(self) -> None:
-        """Force immediate IP rotation (e.g. on block/captcha failure)."""
-        self._rotate()
+    def force_rotate(self) -> Rotation:
+        """Rotate IP now (e.g. on block/captcha failure), without waiting."""
+        return self._rotate()
 
     def reset_counter(self) -> None:
         """Reset the internal query counter."""
         self._query_counter = 0
         logger.debug("Proxy pool query counter reset")
 
-    def _rotate(self) -> None:
-        """Send NEWNYM signal to Tor, respecting minimum wait interval."""
-        elapsed = time.time() - self._last_rotation
-        if elapsed < MIN_ROTATION_WAIT:
-            wait = MIN_ROTATION_WAIT - elapsed
-            logger.debug(f"Waiting {wait:.0f}s before Tor IP rotation")
-            time.sleep(wait)
-        try:
-            with Controller.from_port(port=self.control_port) as ctrl:
-                ctrl.authenticate(password=self.control_password)
-                ctrl.signal(Signal.NEWNYM)  # pyright: ignore[reportAttributeAccessIssue]
+    def _rotate(self) -> Rotation:
+        """Send NEWNYM signal to Tor unless the minimum wait interval has not passed."""
+        with self._rotate_lock:
+            elapsed = time.time() - self._last_rotation
+            if elapsed < MIN_ROTATION_WAIT:
+                logger.debug(f"Tor IP rotation deferred, last one {elapsed:.0f}s ago")
+                return Rotation.TOO_SOON
+            try:
+                self._signal_newnym()
                 self._last_rotation = time.time()
                 logger.info("Tor IP rotated (NEWNYM signal sent)")
+                return Rotation.ROTATED
+            except Exception as e:
+                logger.warning(f"Failed to rotate Tor IP: {e}")
+                return Rotation.FAILED
+
+    def _signal_newnym(self) -> None:
+        """Send NEWNYM on the cached controller, reconnecting once if it went stale."""
+        try:
+            self._get_ctrl().signal(Signal.NEWNYM)  # pyright: ignore[reportAttributeAccessIssue]
         except Exception as e:
-            logger.warning(f"Failed to rotate Tor IP: {e}")
+            logger.debug(f"Tor control connection failed, reconnecting: {e}")
+            self._drop_ctrl()
+            self._get_ctrl().signal(Signal.NEWNYM)  # pyright: ignore[reportAttributeAccessIssue]
+
+    def _get_ctrl(self) -> Controller:
+        """Return the authenticated controller, connecting on first use. Caller holds _rotate_lock."""
+        if self._ctrl is None:
+            ctrl = Controller.from_port(port=self.control_port)
+            try:
+                ctrl.authenticate(password=self.control_password)
+            except Exception:
+                ctrl.close()
+                raise
+            self._ctrl = ctrl
+        return self._ctrl
+
+    def _drop_ctrl(self) -> None:
+        if self._ctrl is not None:
+            try:
+                self._ctrl.close()
+            except Exception:
+                pass
+            self._ctrl = None
@@ -1,16 +1,28 @@
 """Utility functions: config loading and logging setup."""
 
+import functools
 import logging
+import os
 import sys
 from logging.handlers import RotatingFileHandler
 
 import yaml
 
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as _YamlLoader  # type: ignore[assignment]
+
 
 def load_config(config_path: str = "config.yaml") -> dict:
-    """Load configuration from YAML file."""
+    """Load configuration from YAML file (re-parsed only when the file changes)."""
+    return _load_config(config_path, os.path.getmtime(config_path))
+
+
+@functools.lru_cache(maxsize=1)
+def _load_config(config_path: str, _mtime: float) -> dict:
     with open(config_path, "r") as f:
-        return yaml.safe_load(f)  # type: ignore[no-any-return]
+        return yaml.load(f, Loader=_YamlLoader)  # type: ignore[no-any-return]
 
 
 def setup_logging(config: dict) -> logging.Logger:
@@ -18,7 +30,12 @@ def setup_logging(config: dict) -> logging.Logger:
 
     File handler: 10 MB max, 5 backups (configurable via config.yaml).
     Console handler: stdout.
+    Idempotent: once handlers are installed, later calls just return the logger.
     """
+    root = logging.getLogger()
+    if root.hasHandlers():
+        return logging.getLogger("cnmc_scraper")
+
     log_config = config.get("logging", {})
     level_name = str(log_config.get("level", "INFO")).upper()
     level = getattr(logging, level_name, logging.INFO)
@@ -28,10 +45,7 @@ def setup_logging(config: dict) -> logging.Logger:
 
     fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
 
-    root = logging.getLogger()
     root.setLevel(level)
-    # Clear existing handlers to avoid duplicates on re-init
-    root.handlers.clear()
 
     console = logging.StreamHandler(sys.stdout)
     console.setLevel(level)
@@ -0,0 +1,30 @@
+"""Regression tests for scraper.csv_reader."""
+
+from pathlib import Path
+
+from scraper.csv_reader import is_spanish_mobile, read_phones
+
+
+def test_is_spanish_mobile() -> None:
+    assert is_spanish_mobile(b"612345678")
+    assert is_spanish_mobile(b"712345678")
+    assert not is_spanish_mobile(b"912345678")
+    assert not is_spanish_mobile(b"61234567")
+    assert not is_spanish_mobile(b"6123456789")
+    assert not is_spanish_mobile(b"61234567a")
+
+
+def test_read_phones_validates_and_dedupes(tmp_path: Path) -> None:
+    path = tmp_path / "phones.csv"
+    path.write_bytes(b"phone\r\n612345678\r\n\r\n912345678\n 712345678 \n612345678\n600000000")
+    assert read_phones(str(path), config={}) == ["612345678", "712345678", "600000000"]
+
+
+def test_read_phones_empty_file(tmp_path: Path) -> None:
+    path = tmp_path / "phones.csv"
+    path.write_bytes(b"")
+    assert read_phones(str(path), config={}) == []
+
+
+def test_read_phones_missing_file(tmp_path: Path) -> None:
+    assert read_phones(str(tmp_path / "missing.csv"), config={}) == []
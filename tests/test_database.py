@@ -0,0 +1,99 @@
+"""Regression tests for scraper.database."""
+
+import sqlite3
+from pathlib import Path
+
+from scraper.database import Database
+
+
+def _legacy_db(path: Path, rows: list[tuple[str, object]]) -> None:
+    """Create a portability table from before scraped_at was epoch milliseconds."""
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE portability (phone TEXT PRIMARY KEY, operator TEXT, query_date TEXT, scraped_at TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO portability VALUES (?, 'VODAFONE', '01/01/2026', ?)",
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_migrate_scraped_at(tmp_path: Path) -> None:
+    path = tmp_path / "legacy.db"
+    _legacy_db(
+        path,
+        [
+            ("600000001", "2026-01-01T00:00:00+00:00"),
+            ("600000002", "1767225600000"),
+            ("600000003", None),
+            ("600000004", "not a date"),
+        ],
+    )
+
+    db = Database(str(path))
+    try:
+        columns = {row["name"]: row["type"] for row in db.conn.execute("PRAGMA table_info(portability)")}
+        assert columns["scraped_at"] == "INTEGER"
+        scraped = {
+            row["phone"]: row["scraped_at"]
+            for row in db.conn.execute("SELECT phone, scraped_at FROM portability")
+        }
+    finally:
+        db.close()
+
+    assert scraped == {
+        "600000001": 1767225600000,
+        "600000002": 1767225600000,
+        "600000003": None,
+        "600000004": None,
+    }
+
+
+def test_migrate_is_idempotent(tmp_path: Path) -> None:
+    path = tmp_path / "legacy.db"
+    _legacy_db(path, [("600000001", "2026-01-01T00:00:00+00:00")])
+    Database(str(path)).close()
+
+    db = Database(str(path))
+    try:
+        row = db.conn.execute("SELECT scraped_at FROM portability").fetchone()
+    finally:
+        db.close()
+    assert row["scraped_at"] == 1767225600000
+
+
+def test_save_batch_upserts_results_and_progress(tmp_path: Path) -> None:
+    db = Database(str(tmp_path / "cnmc.db"))
+    try:
+        db.save_batch([("600000001", "VODAFONE", "01/01/2026")], "phones.csv", 1)
+        db.save_batch(
+            [("600000001", "ORANGE", "02/01/2026"), ("600000002", "MOVISTAR", "02/01/2026")],
+            "phones.csv",
+            3,
+        )
+
+        rows = {
+            row["phone"]: (row["operator"], row["query_date"], row["scraped_at"])
+            for row in db.conn.execute("SELECT * FROM portability")
+        }
+        assert db.get_progress("phones.csv") == 3
+        assert db.done_phones() == {"600000001", "600000002"}
+    finally:
+        db.close()
+
+    assert rows["600000001"][:2] == ("ORANGE", "02/01/2026")
+    assert rows["600000002"][:2] == ("MOVISTAR", "02/01/2026")
+    # Both rows of a batch share one timestamp
+    assert rows["600000001"][2] == rows["600000002"][2]
+    assert isinstance(rows["600000001"][2], int)
+
+
+def test_done_phones_empty(tmp_path: Path) -> None:
+    db = Database(str(tmp_path / "cnmc.db"))
+    try:
+        assert db.done_phones() == set()
+        assert db.get_progress("phones.csv") == 0
+    finally:
+        db.close()
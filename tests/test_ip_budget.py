@@ -0,0 +1,104 @@
+"""Regression tests for scraper.ip_budget."""
+
+import asyncio
+from collections.abc import Awaitable
+
+from scraper.ip_budget import IpBudget
+
+
+class FakeRotate:
+    def __init__(self, result: bool = True):
+        self.result = result
+        self.calls = 0
+
+    async def __call__(self) -> bool:
+        self.calls += 1
+        return self.result
+
+
+async def _blocked(awaitable: Awaitable[bool]) -> bool:
+    """True if awaitable does not complete within a few loop iterations."""
+    task = asyncio.ensure_future(awaitable)
+    await asyncio.sleep(0.01)
+    if task.done():
+        return False
+    task.cancel()
+    return True
+
+
+def test_budget_blocks_until_last_release_rotates() -> None:
+    async def scenario() -> None:
+        rotate = FakeRotate()
+        budget = IpBudget(2, rotate, asyncio.Event())
+        assert await budget.claim()
+        assert await budget.claim()
+
+        waiter = asyncio.create_task(budget.claim())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+
+        await budget.release()
+        # One query is still in flight on the old IP
+        assert rotate.calls == 0
+        await budget.release()
+        assert rotate.calls == 1
+        assert await waiter
+        assert budget.queries == 1
+
+    asyncio.run(scenario())
+
+
+def test_spend_rotates_after_in_flight_queries() -> None:
+    async def scenario() -> None:
+        rotate = FakeRotate()
+        budget = IpBudget(10, rotate, asyncio.Event())
+        assert await budget.claim()
+        assert await budget.claim()
+        budget.spend()
+        assert await _blocked(budget.claim())
+
+        await budget.release()
+        assert rotate.calls == 0
+        await budget.release()
+        assert rotate.calls == 1
+        assert budget.queries == 0
+
+    asyncio.run(scenario())
+
+
+def test_claim_refused_once_stopping() -> None:
+    async def scenario() -> None:
+        stop = asyncio.Event()
+        budget = IpBudget(1, FakeRotate(), stop)
+        stop.set()
+        assert not await budget.claim()
+
+    asyncio.run(scenario())
+
+
+def test_rotation_abandoned_on_stop_wakes_waiters() -> None:
+    async def scenario() -> None:
+        stop = asyncio.Event()
+        rotate = FakeRotate(result=False)
+        budget = IpBudget(1, rotate, stop)
+        assert await budget.claim()
+        waiter = asyncio.create_task(budget.claim())
+        await asyncio.sleep(0.01)
+
+        stop.set()
+        await budget.release()
+        assert rotate.calls == 1
+        # The budget stays spent and the waiter gives up instead of querying
+        assert budget.queries == 1
+        assert not await waiter
+
+    asyncio.run(scenario())
+
+
+def test_limit_is_at_least_one() -> None:
+    async def scenario() -> None:
+        budget = IpBudget(0, FakeRotate(), asyncio.Event())
+        assert budget.limit == 1
+        assert await budget.claim()
+
+    asyncio.run(scenario())
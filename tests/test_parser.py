@@ -0,0 +1,56 @@
+"""Regression tests for scraper.parser."""
+
+from scraper.parser import PortabilityResult, parse_result
+
+
+def _vuetify_card(phone_label: str, operator_label: str, date_label: str) -> str:
+    return (
+        f'<p class="negrita"> {phone_label}: </p><p>612345678</p>'
+        f'<p class="negrita"> {operator_label}: </p><p>VODAFONE</p>'
+        f'<p class="negrita"> {date_label}: </p><p>01/01/2026</p>'
+    )
+
+
+def test_parse_vuetify_card() -> None:
+    html = _vuetify_card("Número de teléfono", "Operador actual", "Fecha consulta")
+    assert parse_result(html) == PortabilityResult("612345678", "VODAFONE", "01/01/2026")
+
+
+def test_parse_uppercase_labels() -> None:
+    # The label prefilter must be as case-insensitive as the field patterns
+    html = _vuetify_card("NÚMERO DE TELÉFONO", "OPERADOR ACTUAL", "FECHA CONSULTA")
+    assert parse_result(html) == PortabilityResult("612345678", "VODAFONE", "01/01/2026")
+
+
+def test_parse_uppercase_operator_only() -> None:
+    html = '<p class="negrita">OPERADOR ACTUAL:</p><p>VODAFONE</p>'
+    result = parse_result(html)
+    assert result is not None
+    assert result.operator == "VODAFONE"
+
+
+def test_parse_error_page_returns_none() -> None:
+    assert parse_result('<div class="alert">No se ha encontrado el número</div>') is None
+
+
+def test_parse_date_label_far_ahead_of_phone() -> None:
+    # The region must start before the date label, not only the phone/operator ones
+    html = (
+        '<p class="negrita"> Fecha consulta: </p><p>01/01/2026</p>'
+        + "<div></div>" * 100
+        + '<p class="negrita"> Número de teléfono: </p><p>612345678</p>'
+        '<p class="negrita"> Operador actual: </p><p>VODAFONE</p>'
+    )
+    assert parse_result(html) == PortabilityResult("612345678", "VODAFONE", "01/01/2026")
+
+
+def test_parse_mixed_case_label_outside_region() -> None:
+    # A label no marker finds must still be parsed via the whole-page fallback
+    html = (
+        '<p class="negrita">oPERADOR aCTUAL:</p><p>VODAFONE</p>'
+        + "<div></div>" * 100
+        + "<span>Fecha del servidor</span>"
+    )
+    result = parse_result(html)
+    assert result is not None
+    assert result.operator == "VODAFONE"
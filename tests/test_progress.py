@@ -0,0 +1,36 @@
+"""Regression tests for scraper.progress."""
+
+from scraper.progress import ProgressWatermark
+
+
+def test_watermark_waits_for_earlier_lines() -> None:
+    progress = ProgressWatermark(10)
+    progress.mark_done(1)
+    progress.mark_done(2)
+    assert progress.line == 0
+    progress.mark_done(0)
+    assert progress.line == 3
+
+
+def test_watermark_starts_at_resume_line() -> None:
+    progress = ProgressWatermark(20, start_line=8)
+    progress.mark_done(9)
+    assert progress.line == 8
+    progress.mark_done(8)
+    assert progress.line == 10
+
+
+def test_watermark_stops_at_total() -> None:
+    progress = ProgressWatermark(3)
+    for idx in (2, 1, 0):
+        progress.mark_done(idx)
+    assert progress.line == 3
+
+
+def test_watermark_spans_bitmap_bytes() -> None:
+    progress = ProgressWatermark(20)
+    for idx in range(1, 17):
+        progress.mark_done(idx)
+    assert progress.line == 0
+    progress.mark_done(0)
+    assert progress.line == 17